@@ -1,16 +1,29 @@
+# startup is timed from before the remaining imports so the reported time includes them
+import time
+startup_begin = time.perf_counter()
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, Form, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
 import os
-from utilities import get_datasets, get_random_image
+import uuid
+from utilities import get_datasets, get_random_image, get_memory_report
 from dataset_downloader import DatasetDownloader
 from image_analyzer import ImageAnalyzer
-from mosaic import Mosaic
+from mosaic import Mosaic, OUTPUT_FORMATS, encode_image, load_color_index, normalize_output_format, preload_modules
 from typing import Optional, Dict
 import json
-import time
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # runs in each worker after fork. rss counts pages shared with a preloaded master,
+    # pss/private show how much memory the worker actually adds
+    print(f"worker {os.getpid()} ready, {get_memory_report()}")
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # configure cors
 app.add_middleware(
@@ -19,6 +32,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Encode-Time-Ms", "X-Encoded-Bytes", "X-Palette", "Content-Disposition"],
 )
 
 # configure upload folder
@@ -29,6 +43,49 @@ os.makedirs(MOSAIC_FOLDER, exist_ok=True)
 downloader = DatasetDownloader()
 analyzer = ImageAnalyzer()
 
+# datasets whose color indexes are loaded at import, e.g. "butterflies,animal-faces" or "all".
+# with gunicorn --preload this happens once before forking so workers share them copy-on-write
+PRELOAD_DATASETS = os.environ.get("MOSAIC_PRELOAD_DATASETS", "")
+
+def preload_color_indexes(dataset_names: str):
+    # import the heavy modules too so workers don't each import them on first request
+    preload_modules()
+
+    if dataset_names.strip() == "all":
+        names = [dataset["name"] for dataset in get_datasets()]
+    else:
+        names = [name.strip() for name in dataset_names.split(",") if name.strip()]
+
+    for dataset_name in names:
+        analysis_dir = os.path.join("datasets", dataset_name, "analysis")
+        analysis_path = os.path.join(analysis_dir, "center_crop_avg_colors.csv")
+        if not os.path.exists(analysis_path):
+            print(f"skipping preload of {dataset_name}: analysis not found")
+            continue
+        color_data, _ = load_color_index(analysis_path)
+        print(f"preloaded color index for {dataset_name} ({len(color_data)} images)")
+
+        compact_path = os.path.join(analysis_dir, "center_crop_avg_colors_compact.csv")
+        if os.path.exists(compact_path):
+            color_data, _ = load_color_index(compact_path)
+            print(f"preloaded compact color index for {dataset_name} ({len(color_data)} images)")
+
+if PRELOAD_DATASETS:
+    preload_color_indexes(PRELOAD_DATASETS)
+
+startup_seconds = time.perf_counter() - startup_begin
+print(f"app loaded in {startup_seconds:.2f}s (pid {os.getpid()}, {get_memory_report()})")
+
+# running encode metrics per output format. these live in each worker process, so with
+# multiple gunicorn workers /mosaic/metrics reports only the worker that served the call
+encode_metrics = {}
+
+def record_encode_stats(stats: Dict):
+    metrics = encode_metrics.setdefault(stats["format"], {"count": 0, "total_encode_ms": 0.0, "total_bytes": 0})
+    metrics["count"] += 1
+    metrics["total_encode_ms"] += stats["encode_ms"]
+    metrics["total_bytes"] += stats["size_bytes"]
+
 @app.get("/")
 async def index():
     return {"message": "Welcome to the Mosaic Creator API"}
@@ -60,25 +117,60 @@ async def download_dataset(request: Dict):
             
         is_duplicate, dataset_name, img_count = downloader.duplicate_check(url)
         if not is_duplicate:
-            downloader.download_dataset(url)
-            analyzer.analyze_dataset(dataset_name)
-            return {"message": "dataset downloaded and analyzed", "dataset_name": dataset_name}
+            compact = bool(request.get("compact", False))
+            # download and analysis are slow, keep them off the event loop
+            await run_in_threadpool(downloader.download_dataset, url)
+            await run_in_threadpool(analyzer.analyze_dataset, dataset_name, compact=compact)
+            response = {"message": "dataset downloaded and analyzed", "dataset_name": dataset_name}
+            if compact:
+                response["compaction_report"] = analyzer.get_compaction_report(dataset_name)
+            return response
         else:
             return {"message": "dataset already exists", "dataset_name": dataset_name, "image_count": img_count}
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/datasets/{dataset_name}/analyze")
+async def analyze_existing_dataset(dataset_name: str, request: Optional[Dict] = Body(None)):
+    try:
+        request = request or {}
+        compact = bool(request.get("compact", False))
+        options = {key: request[key] for key in ("hash_threshold", "color_cell_size", "max_per_cell") if key in request}
+        await run_in_threadpool(
+            analyzer.analyze_dataset,
+            dataset_name,
+            compact=compact,
+            **options
+        )
+        response = {"message": "dataset analyzed", "dataset_name": dataset_name}
+        if compact:
+            response["compaction_report"] = analyzer.get_compaction_report(dataset_name)
+        return response
+    except Exception as e:
+        return {"error": str(e)}
+
 @app.post("/mosaic/create")
 async def create_mosaic(
     file: UploadFile = File(...),
     dataset_name: str = Form(...),
     output_width: Optional[int] = Form(100),
     tile_size: Optional[int] = Form(32),
-    config: Optional[str] = Form(None)
+    config: Optional[str] = Form(None),
+    output_format: Optional[str] = Form("jpeg"),
+    quality: Optional[int] = Form(95),
+    progressive: Optional[bool] = Form(False),
+    png_compression: Optional[int] = Form(3),
+    stream: Optional[bool] = Form(False),
+    compact_palette: Optional[bool] = Form(False)
 ):
+    # Save uploads under a unique name so overlapping requests can't clobber each other,
+    # keeping only the client's extension (needed to detect formats like heic)
+    upload_extension = os.path.splitext(os.path.basename(file.filename or ""))[1].lower()
+    if not upload_extension[1:].isalnum():
+        upload_extension = ""
+    file_path = os.path.join(MOSAIC_FOLDER, f"upload_{uuid.uuid4().hex}{upload_extension}")
     try:
         # Save uploaded file
-        file_path = os.path.join(MOSAIC_FOLDER, file.filename)
         with open(file_path, "wb") as f:
             content = await file.read()
             f.write(content)
@@ -90,22 +182,59 @@ async def create_mosaic(
         if not os.path.exists(analysis_path):
             raise ValueError(f"Dataset analysis not found for {dataset_name}")
 
-        # Create mosaic
-        mosaic_creator = Mosaic(
-            avg_colors_csv=analysis_path,
-            target_image_path=file_path,
-            output_width=output_width,
-            mosaic_image_size=tile_size
+        # Use the compacted palette if requested
+        palette = "full"
+        if compact_palette:
+            analysis_path = os.path.join(dataset_path, "analysis", "center_crop_avg_colors_compact.csv")
+            if not os.path.exists(analysis_path):
+                raise ValueError(f"Compact palette not found for {dataset_name}, analyze it with compact enabled first")
+            palette = "compact"
+
+        output_format = normalize_output_format(output_format)
+        extension, media_type = OUTPUT_FORMATS[output_format]
+
+        def build_mosaic():
+            mosaic_creator = Mosaic(
+                avg_colors_csv=analysis_path,
+                target_image_path=file_path,
+                output_width=output_width,
+                mosaic_image_size=tile_size
+            )
+            return mosaic_creator.create_mosaic()
+
+        # Create mosaic and encode it off the event loop
+        mosaic = await run_in_threadpool(build_mosaic)
+        data, stats = await run_in_threadpool(
+            encode_image,
+            mosaic,
+            output_format,
+            quality=quality,
+            progressive=progressive,
+            png_compression=png_compression
         )
-        
+        record_encode_stats(stats)
+        metric_headers = {
+            "X-Encode-Time-Ms": str(stats["encode_ms"]),
+            "X-Encoded-Bytes": str(stats["size_bytes"]),
+            "X-Palette": palette
+        }
+
         # Generate unique filename for output
-        output_filename = f"mosaic_{int(time.time())}.jpg"
+        output_filename = f"mosaic_{uuid.uuid4().hex}{extension}"
+
+        if stream:
+            # Send encoded bytes directly without writing to disk
+            return Response(
+                content=data,
+                media_type=media_type,
+                headers={"Content-Disposition": f"attachment; filename={output_filename}", **metric_headers}
+            )
+
         output_path = os.path.join(MOSAIC_FOLDER, output_filename)
+        with open(output_path, "wb") as f:
+            f.write(data)
         
-        # Create mosaic
-        mosaic_creator.create_mosaic(output_path)
-        
-        return {"filename": output_filename}
+        return {"filename": output_filename, "encode_stats": stats, "palette": palette}
         
     except Exception as e:
         return {"error": str(e)}
@@ -114,13 +243,27 @@ async def create_mosaic(
         if os.path.exists(file_path):
             os.remove(file_path)
 
+@app.get("/mosaic/metrics")
+async def get_encode_metrics():
+    # metrics are per worker process; pid identifies which worker answered
+    metrics = {}
+    for output_format, totals in encode_metrics.items():
+        metrics[output_format] = {
+            **totals,
+            "avg_encode_ms": round(totals["total_encode_ms"] / totals["count"], 2),
+            "avg_bytes": totals["total_bytes"] // totals["count"]
+        }
+    return {"data": metrics, "pid": os.getpid()}
+
 @app.get("/mosaic/{filename}")
 async def serve_mosaic(filename: str):
     file_path = os.path.join(MOSAIC_FOLDER, filename)
     if os.path.exists(file_path):
+        extension = os.path.splitext(filename)[1].lower()
+        media_type = next((m for ext, m in OUTPUT_FORMATS.values() if ext == extension), 'image/jpeg')
         return FileResponse(
             file_path,
-            media_type='image/jpeg',
+            media_type=media_type,
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
     else:
@@ -2,7 +2,6 @@ import os
 import shutil
 from tqdm import tqdm
 import zipfile
-from kaggle.api.kaggle_api_extended import KaggleApi
 
 class DatasetDownloader:
     def __init__(self, base_path: str = "datasets"):
@@ -13,9 +12,20 @@ class DatasetDownloader:
             base_path (str): base directory to store all datasets
         """
         self.base_path = base_path
-        self.api = KaggleApi()
+        self._api = None
         self.image_extensions = ('.jpg')  # what counts as an "image"
         
+    @property
+    def api(self):
+        """
+        kaggle api client, imported and created on first use since importing
+        kaggle is slow and reads credentials.
+        """
+        if self._api is None:
+            from kaggle.api.kaggle_api_extended import KaggleApi
+            self._api = KaggleApi()
+        return self._api
+
     def _create_dataset_directory(self, dataset_name: str) -> str:
         """
         create the directory structure for a dataset.
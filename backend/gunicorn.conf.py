@@ -0,0 +1,11 @@
+# gunicorn config for running the api with multiple uvicorn workers.
+# usage (from the backend folder): gunicorn app:app -c gunicorn.conf.py
+import os
+
+bind = os.environ.get("MOSAIC_BIND", "0.0.0.0:5002")
+workers = int(os.environ.get("MOSAIC_WORKERS", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# import the app (and any MOSAIC_PRELOAD_DATASETS color indexes) once in the
+# master process so forked workers share that memory copy-on-write
+preload_app = True
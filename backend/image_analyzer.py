@@ -1,8 +1,18 @@
 import os
-import cv2
 import multiprocessing
 from tqdm import tqdm
 import csv
+import json
+from functools import partial
+import numpy as np
+from utilities import lazy_import
+
+# heavy modules are imported on first use to keep server startup fast
+cv2 = lazy_import("cv2")
+scipy_spatial = lazy_import("scipy.spatial")
+
+# number of set bits in each byte value, for hamming distances between hashes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
 
 class ImageAnalyzer:
     def __init__(self, dataset_path: str = "datasets"):
@@ -16,21 +26,22 @@ class ImageAnalyzer:
         self.n_workers = multiprocessing.cpu_count()
         self.image_extensions = ('.jpg')  # what counts as an "image", setting to jpg for now to avoid alhpa channels
     
-    def _get_center_crop_avg_color(self, image_path: str) -> tuple:
+    def _get_center_crop_avg_color(self, image_path: str, compute_hash: bool = False) -> tuple:
         """
         calculate the average color of the center square crop of an image.
         
         args:
             image_path (str): path to the image file
+            compute_hash (bool): also compute a 64 bit perceptual (difference) hash of the crop
             
         returns:
-            tuple: (image_name, (r, g, b)) or (image_name, None) if error
+            tuple: (image_name, (r, g, b), hash) or (image_name, None, None) if error. hash is None unless requested
         """
         try:
             # read image in BGR format
             img = cv2.imread(image_path)
             if img is None:
-                return os.path.basename(image_path), None
+                return os.path.basename(image_path), None, None
             
             # get dimensions
             h, w = img.shape[:2]
@@ -48,23 +59,171 @@ class ImageAnalyzer:
             
             # convert BGR to RGB and return as ints
             rgb = tuple(int(c) for c in avg_color[::-1])
-            return os.path.basename(image_path), rgb
+            
+            # difference hash: compare neighbouring pixels of a 9x8 grayscale thumbnail
+            phash = None
+            if compute_hash:
+                gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+                small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+                bits = (small[:, 1:] > small[:, :-1]).flatten()
+                phash = int(np.packbits(bits).view('>u8')[0])
+            
+            return os.path.basename(image_path), rgb, phash
             
         except Exception as e:
             print(f"error processing {image_path}: {e}")
-            return os.path.basename(image_path), None
+            return os.path.basename(image_path), None, None
     
-    def analyze_dataset(self, dataset_name: str) -> str:
+    def _dedupe_hashes(self, hashes: np.ndarray, colors: np.ndarray, hash_threshold: int, color_cell_size: int) -> np.ndarray:
+        """
+        find near-duplicate images using multi-index hashing.
+        
+        the 64 hash bits are split into hash_threshold + 1 chunks; two hashes within
+        hash_threshold bits of each other must match exactly on at least one chunk, so
+        each image is only compared against kept images sharing a chunk value. an image is
+        a near-duplicate if it is within hash_threshold bits and color_cell_size per channel
+        of a kept image, so matches across color cell boundaries are still found.
+        
+        args:
+            hashes (np.ndarray): uint64 hash per image
+            colors (np.ndarray): (n, 3) rgb color per image
+            hash_threshold (int): max hamming distance between hashes to count as a near-duplicate
+            color_cell_size (int): max per channel color difference to count as a near-duplicate
+            
+        returns:
+            np.ndarray: boolean mask of images to keep (the first of each near-duplicate group)
+        """
+        chunk_bits = np.array_split(np.arange(64), hash_threshold + 1)
+        chunk_shifts = [np.uint64(bits[0]) for bits in chunk_bits]
+        chunk_masks = [np.uint64((1 << len(bits)) - 1) for bits in chunk_bits]
+        chunk_tables = [{} for _ in chunk_bits]
+        
+        keep = np.zeros(len(hashes), dtype=bool)
+        for i, image_hash in enumerate(hashes):
+            chunks = [int((image_hash >> shift) & mask) for shift, mask in zip(chunk_shifts, chunk_masks)]
+            
+            candidates = set()
+            for table, chunk in zip(chunk_tables, chunks):
+                candidates.update(table.get(chunk, ()))
+            
+            if candidates:
+                candidates = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                xor = np.bitwise_xor(hashes[candidates], image_hash)
+                distances = _POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+                color_diffs = np.abs(colors[candidates] - colors[i]).max(axis=1)
+                if np.any((distances <= hash_threshold) & (color_diffs <= color_cell_size)):
+                    continue
+            
+            keep[i] = True
+            for table, chunk in zip(chunk_tables, chunks):
+                table.setdefault(chunk, []).append(i)
+        
+        return keep
+    
+    def _spread_sample(self, colors: np.ndarray, count: int) -> list:
+        """
+        pick count colors spread across a set using farthest point sampling, starting
+        from the color closest to the mean.
+        
+        returns:
+            list: indices of the picked colors
+        """
+        colors = colors.astype(np.float64)
+        first = int(np.argmin(np.linalg.norm(colors - colors.mean(axis=0), axis=1)))
+        picks = [first]
+        min_distances = np.linalg.norm(colors - colors[first], axis=1)
+        # mark picked colors below any distance so identical colors aren't picked twice
+        min_distances[first] = -1
+        while len(picks) < count:
+            next_pick = int(np.argmax(min_distances))
+            picks.append(next_pick)
+            min_distances = np.minimum(min_distances, np.linalg.norm(colors - colors[next_pick], axis=1))
+            min_distances[next_pick] = -1
+        return picks
+    
+    def _compact_palette(self, results: list, hash_threshold: int, color_cell_size: int, max_per_cell: int) -> list:
+        """
+        drop near-duplicate images and cap how many images share a region of color space.
+        
+        near-duplicates are removed first (see _dedupe_hashes). the remaining images are
+        clustered into cubic cells of color_cell_size in rgb space and at most max_per_cell
+        images are kept per cell, spread across the cell's colors.
+        
+        args:
+            results (list): (image_name, (r, g, b), hash) tuples from analysis
+            hash_threshold (int): max hamming distance between hashes to count as a near-duplicate
+            color_cell_size (int): edge length of each color cell
+            max_per_cell (int): max images kept per color cell
+            
+        returns:
+            list: the kept (image_name, (r, g, b), hash) tuples
+        """
+        hashes = np.array([result[2] for result in results], dtype=np.uint64)
+        colors = np.array([result[1] for result in results], dtype=np.int64)
+        keep = self._dedupe_hashes(hashes, colors, hash_threshold, color_cell_size)
+        
+        cells = {}
+        for i in np.flatnonzero(keep):
+            cell = tuple(colors[i] // color_cell_size)
+            cells.setdefault(cell, []).append(i)
+        
+        kept = []
+        for members in cells.values():
+            # cap over-represented regions, keeping a spread of colors
+            if len(members) > max_per_cell:
+                members = [members[j] for j in self._spread_sample(colors[members], max_per_cell)]
+            kept.extend(members)
+        
+        return [results[i] for i in sorted(kept)]
+    
+    def _palette_match_error(self, colors: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """
+        rgb distance from each query color to its closest palette color.
+        """
+        distances, _ = scipy_spatial.cKDTree(colors).query(queries)
+        return distances
+    
+    def _write_colors_csv(self, output_file: str, results: list):
+        """
+        write (image_name, (r, g, b), hash) analysis results to an average colors csv.
+        """
+        with open(output_file, "w", newline="") as csvfile:
+            csvwriter = csv.writer(csvfile)
+            csvwriter.writerow(["image_name", "r", "g", "b"])
+            
+            for img_name, color, _ in results:
+                csvwriter.writerow([img_name, *color])
+    
+    def analyze_dataset(self, dataset_name: str, compact: bool = False, hash_threshold: int = 6,
+                        color_cell_size: int = 16, max_per_cell: int = 8) -> str:
         """
         analyze all images in a dataset and generate a csv with average rgb values
         of center square crops.
         
+        if compact is set, perceptual hashes are also computed and a compacted palette
+        (center_crop_avg_colors_compact.csv) is written without near-duplicates and with
+        over-represented colors capped, along with compaction_report.json describing
+        how much smaller it is and how far the dataset's own colors now are from their
+        closest match (the full palette matches each of them exactly).
+        
         args:
             dataset_name (str): name of the dataset folder
+            compact (bool): also produce the compacted palette and report
+            hash_threshold (int): max hash hamming distance (0-63) to treat images as near-duplicates
+            color_cell_size (int): edge length of the rgb cells used to cluster colors
+            max_per_cell (int): max images kept per color cell
             
         returns:
             str: path to the generated csv file
         """
+        if compact:
+            if not 0 <= hash_threshold < 64:
+                raise ValueError(f"hash_threshold must be between 0 and 63, got {hash_threshold}")
+            if color_cell_size < 1:
+                raise ValueError(f"color_cell_size must be at least 1, got {color_cell_size}")
+            if max_per_cell < 1:
+                raise ValueError(f"max_per_cell must be at least 1, got {max_per_cell}")
+        
         # get path to images
         dataset_dir = os.path.join(self.dataset_path, dataset_name, "images")
         if not os.path.exists(dataset_dir):
@@ -83,7 +242,7 @@ class ImageAnalyzer:
         with ctx.Pool(processes=self.n_workers) as pool:
             try:
                 results = list(tqdm(
-                    pool.imap(self._get_center_crop_avg_color, image_files),
+                    pool.imap(partial(self._get_center_crop_avg_color, compute_hash=compact), image_files),
                     total=len(image_files),
                     desc="Processing images"
                 ))
@@ -95,14 +254,61 @@ class ImageAnalyzer:
         os.makedirs(analysis_dir, exist_ok=True)
         
         # save results
+        results = [result for result in results if result[1]]
         output_file = os.path.join(analysis_dir, "center_crop_avg_colors.csv")
-        with open(output_file, "w", newline="") as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(["image_name", "r", "g", "b"])
-            
-            for img_name, color in results:
-                if color: 
-                    csvwriter.writerow([img_name, *color])
+        self._write_colors_csv(output_file, results)
         
         print(f"analysis complete!! results saved to: {output_file}")
-        return output_file 
\ No newline at end of file
+        
+        compact_file = os.path.join(analysis_dir, "center_crop_avg_colors_compact.csv")
+        report_file = os.path.join(analysis_dir, "compaction_report.json")
+        if not (compact and results):
+            # drop any compact palette from an earlier analysis, it no longer matches the image set
+            for stale_file in (compact_file, report_file):
+                if os.path.exists(stale_file):
+                    os.remove(stale_file)
+        else:
+            compacted = self._compact_palette(results, hash_threshold, color_cell_size, max_per_cell)
+            self._write_colors_csv(compact_file, compacted)
+            
+            # error on the dataset's own colors, which the full palette matches exactly
+            all_colors = np.array([r[1] for r in results])
+            errors = self._palette_match_error(np.array([r[1] for r in compacted]), all_colors)
+            kept_names = {r[0] for r in compacted}
+            dropped = np.array([r[0] not in kept_names for r in results])
+            dropped_errors = errors[dropped]
+            report = {
+                "original_count": len(results),
+                "compacted_count": len(compacted),
+                "reduction_pct": round(100 * (1 - len(compacted) / len(results)), 2),
+                "mean_match_error_increase": round(float(errors.mean()), 3),
+                "mean_match_error_dropped": round(float(dropped_errors.mean()), 3) if len(dropped_errors) else 0.0,
+                "max_match_error_dropped": round(float(dropped_errors.max()), 3) if len(dropped_errors) else 0.0,
+                "hash_threshold": hash_threshold,
+                "color_cell_size": color_cell_size,
+                "max_per_cell": max_per_cell
+            }
+            with open(report_file, "w") as f:
+                json.dump(report, f, indent=2)
+            
+            print(f"compacted palette from {len(results)} to {len(compacted)} images "
+                  f"({report['reduction_pct']}% smaller), mean match error on dataset colors "
+                  f"+{report['mean_match_error_increase']}. saved to: {compact_file}")
+        
+        return output_file
+    
+    def get_compaction_report(self, dataset_name: str) -> dict:
+        """
+        load the compaction report written by the last compacting analysis of a dataset.
+        
+        args:
+            dataset_name (str): name of the dataset folder
+            
+        returns:
+            dict: the report, or None if the dataset has no compact palette
+        """
+        report_file = os.path.join(self.dataset_path, dataset_name, "analysis", "compaction_report.json")
+        if not os.path.exists(report_file):
+            return None
+        with open(report_file) as f:
+            return json.load(f)
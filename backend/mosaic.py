@@ -1,11 +1,104 @@
 import os
-import cv2
 import numpy as np
-import pandas as pd
-from scipy.spatial import cKDTree
 from tqdm import tqdm
-from PIL import Image
-import pillow_heif
+import time
+from utilities import lazy_import
+
+# heavy modules are imported on first use to keep server startup fast
+cv2 = lazy_import("cv2")
+pd = lazy_import("pandas")
+scipy_spatial = lazy_import("scipy.spatial")
+Image = lazy_import("PIL.Image")
+pillow_heif = lazy_import("pillow_heif")
+
+def preload_modules():
+    """
+    import the lazily loaded heavy modules now, e.g. before forking workers.
+    """
+    for module in (cv2, pd, scipy_spatial, Image, pillow_heif):
+        module.load()
+
+# supported output formats: format name -> (file extension, media type)
+OUTPUT_FORMATS = {
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+    "png": (".png", "image/png"),
+}
+
+def normalize_output_format(output_format: str) -> str:
+    """
+    get the canonical OUTPUT_FORMATS name for a format or extension (e.g. "JPG", ".jpg" -> "jpeg").
+    
+    raises:
+        ValueError: if the format is not supported
+    """
+    output_format = output_format.lower().lstrip('.')
+    if output_format == "jpg":
+        output_format = "jpeg"
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"unsupported output format: {output_format}")
+    return output_format
+
+def encode_image(image: np.ndarray, output_format: str = "jpeg", quality: int = 95,
+                 progressive: bool = False, png_compression: int = 3) -> tuple:
+    """
+    encode an image array to bytes in the requested format.
+    
+    args:
+        image (np.ndarray): image in BGR format
+        output_format (str): one of OUTPUT_FORMATS ("jpeg", "webp", "png")
+        quality (int): jpeg/webp quality, 1-100
+        progressive (bool): write a progressive jpeg
+        png_compression (int): png zlib compression level, 0-9
+        
+    returns:
+        tuple: (encoded bytes, stats dict with format, encode_ms and size_bytes)
+    """
+    output_format = normalize_output_format(output_format)
+    
+    quality = min(max(int(quality), 1), 100)
+    if output_format == "jpeg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_PROGRESSIVE, int(progressive)]
+    elif output_format == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, min(max(int(png_compression), 0), 9)]
+    
+    start = time.perf_counter()
+    ok, buffer = cv2.imencode(OUTPUT_FORMATS[output_format][0], image, params)
+    encode_ms = (time.perf_counter() - start) * 1000
+    if not ok:
+        raise ValueError(f"could not encode image as {output_format}")
+    
+    data = buffer.tobytes()
+    stats = {"format": output_format, "encode_ms": round(encode_ms, 2), "size_bytes": len(data)}
+    return data, stats
+
+# color indexes shared across requests (and across workers when preloaded before fork)
+_color_index_cache = {}
+
+def load_color_index(avg_colors_csv: str) -> tuple:
+    """
+    load a dataset's average colors and build its k-d tree, reusing a cached copy
+    if the csv has not changed since it was loaded.
+    
+    args:
+        avg_colors_csv (str): path to csv containing image names and their average rgb values
+        
+    returns:
+        tuple: (color dataframe, k-d tree over the rgb values)
+    """
+    key = os.path.abspath(avg_colors_csv)
+    mtime = os.path.getmtime(avg_colors_csv)
+    cached = _color_index_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1], cached[2]
+    
+    color_data = pd.read_csv(avg_colors_csv)
+    # create k-d tree for efficient nearest neighbor search
+    color_tree = scipy_spatial.cKDTree(color_data[['r', 'g', 'b']].values)
+    _color_index_cache[key] = (mtime, color_data, color_tree)
+    return color_data, color_tree
 
 class Mosaic:
     def __init__(self, avg_colors_csv: str, target_image_path: str, output_width: int, mosaic_image_size: int):
@@ -35,13 +128,10 @@ class Mosaic:
         """
         setup the color matching system using a k-d tree.
         """
-        self.color_data = pd.read_csv(avg_colors_csv)
+        self.color_data, self.color_tree = load_color_index(avg_colors_csv)
         
-        # convert to np array for k-d tree
-        self.colors = self.color_data[['r', 'g', 'b']].values
-        
-        # create k-d tree for efficient nearest neighbor search
-        self.color_tree = cKDTree(self.colors)
+        # np array of rgb values backing the k-d tree
+        self.colors = self.color_tree.data
         
         # store base path
         self.source_images_path = os.path.join(os.path.dirname(avg_colors_csv), "..", "images")
@@ -128,12 +218,15 @@ class Mosaic:
 
 
     
-    def create_mosaic(self, output_path: str = None):
+    def create_mosaic(self, output_path: str = None, output_format: str = None, **encode_options):
         """
         create the mosaic image.
         
         args:
             output_path (str, optional): path to save the output image. if none, just returns the array
+            output_format (str, optional): format to save as, inferred from the output path extension if none.
+                extensions outside OUTPUT_FORMATS (e.g. .bmp, .tiff) are written with cv2.imwrite defaults
+            **encode_options: quality, progressive and png_compression passed to encode_image
             
         returns:
             np.ndarray: the created mosaic image
@@ -174,6 +267,14 @@ class Mosaic:
                 mosaic[y_start:y_end, x_start:x_end] = tile
         
         if output_path:
-            cv2.imwrite(output_path, mosaic)
+            extension = os.path.splitext(output_path)[1]
+            if output_format is None and extension.lower().lstrip('.') not in (*OUTPUT_FORMATS, "jpg"):
+                # let opencv handle any other format it supports
+                cv2.imwrite(output_path, mosaic)
+            else:
+                data, stats = encode_image(mosaic, output_format or extension, **encode_options)
+                with open(output_path, "wb") as f:
+                    f.write(data)
+                print(f"encoded {stats['format']} in {stats['encode_ms']}ms ({stats['size_bytes']} bytes)")
             
-        return mosaic
\ No newline at end of file
+        return mosaic
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# backend modules import each other as top level modules (e.g. "from utilities import ...")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
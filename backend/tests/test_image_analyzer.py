@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from image_analyzer import ImageAnalyzer
+
+
+def brute_force_keep(hashes, colors, hash_threshold, color_cell_size):
+    # reference O(n^2) version of ImageAnalyzer._dedupe_hashes
+    kept = []
+    for i in range(len(hashes)):
+        duplicate = any(
+            bin(int(hashes[i]) ^ int(hashes[j])).count("1") <= hash_threshold
+            and np.abs(colors[i] - colors[j]).max() <= color_cell_size
+            for j in kept
+        )
+        if not duplicate:
+            kept.append(i)
+    keep = np.zeros(len(hashes), dtype=bool)
+    keep[kept] = True
+    return keep
+
+
+def synthetic_images(n_groups=40, group_size=6, seed=0):
+    # groups of hashes a few bit flips apart from a shared base, with nearby colors
+    rng = np.random.default_rng(seed)
+    hashes, colors = [], []
+    for _ in range(n_groups):
+        base_hash = int(rng.integers(0, 2**63)) | (int(rng.integers(0, 2)) << 63)
+        base_color = rng.integers(0, 256, size=3)
+        for _ in range(group_size):
+            flips = rng.choice(64, size=rng.integers(0, 12), replace=False)
+            image_hash = base_hash
+            for bit in flips:
+                image_hash ^= 1 << int(bit)
+            hashes.append(image_hash)
+            colors.append(np.clip(base_color + rng.integers(-20, 21, size=3), 0, 255))
+    return np.array(hashes, dtype=np.uint64), np.array(colors, dtype=np.int64)
+
+
+@pytest.mark.parametrize("hash_threshold", [0, 1, 6, 20, 63])
+def test_dedupe_matches_brute_force(hash_threshold):
+    hashes, colors = synthetic_images()
+    keep = ImageAnalyzer()._dedupe_hashes(hashes, colors, hash_threshold, 16)
+    np.testing.assert_array_equal(keep, brute_force_keep(hashes, colors, hash_threshold, 16))
+
+
+def test_dedupe_across_cell_boundary():
+    hashes = np.array([0xFF, 0xFE], dtype=np.uint64)
+    colors = np.array([[15, 0, 0], [16, 0, 0]])
+    keep = ImageAnalyzer()._dedupe_hashes(hashes, colors, 6, 16)
+    assert keep.tolist() == [True, False]
+
+
+def test_compact_palette_caps_identical_color_cell():
+    rng = np.random.default_rng(1)
+    results = [(f"{i}.jpg", (200, 200, 200), int(rng.integers(0, 2**63))) for i in range(20)]
+    compacted = ImageAnalyzer()._compact_palette(results, 6, 16, 8)
+    names = [result[0] for result in compacted]
+    assert len(names) == 8
+    assert len(set(names)) == 8
+
+
+def test_spread_sample_covers_extremes():
+    colors = np.array([[0, 0, 0], [1, 1, 1], [2, 2, 2], [10, 10, 10], [5, 5, 5]])
+    picks = ImageAnalyzer()._spread_sample(colors, 3)
+    assert set(picks) == {0, 3, 4}
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"hash_threshold": 64}, "hash_threshold"),
+    ({"color_cell_size": 0}, "color_cell_size"),
+    ({"max_per_cell": 0}, "max_per_cell"),
+])
+def test_analyze_dataset_validates_compact_options(tmp_path, options, message):
+    with pytest.raises(ValueError, match=message):
+        ImageAnalyzer(str(tmp_path)).analyze_dataset("missing", compact=True, **options)
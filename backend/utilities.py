@@ -1,5 +1,7 @@
 import os
 import random
+import sys
+import importlib
 
 def get_datasets(datasets_dir: str = "datasets"):
     datasets = []
@@ -19,3 +21,87 @@ def get_random_image(dataset_name: str, datasets_dir: str = "datasets"):
         raise ValueError(f"No images found in dataset: {dataset_name}")
     random_image = random.choice(images)
     return os.path.join(images_dir, random_image)
+
+
+class LazyModule:
+    """
+    stand-in for a module that is only imported on first attribute access.
+    keeps heavy dependencies (opencv, pandas, scipy, kaggle...) out of server startup.
+    """
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def load(self):
+        """
+        import the module now if it hasn't been already and return it.
+        """
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __reduce__(self):
+        # copy/pickle by name only, since module objects can't be pickled
+        return LazyModule, (self._name,)
+
+    def __getattr__(self, attr):
+        # private names are never proxied, otherwise copy/pickle probing attributes
+        # before __init__ has run would recurse through self._module
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.load(), attr)
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+def get_rss_mb() -> float:
+    """
+    get the resident set size of the current process in MB.
+    falls back to peak rss where /proc is not available, and 0 if neither is.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    # ru_maxrss is in bytes on macos and KB elsewhere
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+def get_shared_memory_mb() -> dict:
+    """
+    get proportional (pss) and private memory of the current process in MB from
+    /proc/self/smaps_rollup. unlike rss, these don't count copy-on-write pages shared
+    with a preloaded parent in full, so they show what each forked worker really costs.
+    
+    returns:
+        dict: {"pss": float, "private": float}, or an empty dict where smaps_rollup is not available
+    """
+    memory = {"pss": 0.0, "private": 0.0}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field == "Pss":
+                    memory["pss"] += int(value.split()[0]) / 1024
+                elif field in ("Private_Clean", "Private_Dirty"):
+                    memory["private"] += int(value.split()[0]) / 1024
+    except OSError:
+        return {}
+    return memory
+
+def get_memory_report() -> str:
+    """
+    one line summary of this process's memory, e.g. "rss 410.2MB, pss 180.5MB, private 95.1MB".
+    """
+    report = f"rss {get_rss_mb():.1f}MB"
+    shared = get_shared_memory_mb()
+    if shared:
+        report += f", pss {shared['pss']:.1f}MB, private {shared['private']:.1f}MB"
+    return report
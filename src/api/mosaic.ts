@@ -1,4 +1,4 @@
-import { MosaicConfig, ApiResponse } from './types';
+import { MosaicConfig, MosaicOutputOptions, ApiResponse } from './types';
 
 const API_BASE_URL = 'http://localhost:5002';
 
@@ -8,7 +8,8 @@ export const createMosaic = async (
   config: MosaicConfig,
   dataset_name: string,
   output_width: number = 100,
-  tile_size: number = 32
+  tile_size: number = 32,
+  output: MosaicOutputOptions = {}
 ): Promise<ApiResponse<string>> => {
   try {
     const formData = new FormData();
@@ -17,12 +18,24 @@ export const createMosaic = async (
     formData.append('output_width', output_width.toString());
     formData.append('tile_size', tile_size.toString());
     formData.append('config', JSON.stringify(config));
+    if (output.outputFormat) formData.append('output_format', output.outputFormat);
+    if (output.quality !== undefined) formData.append('quality', output.quality.toString());
+    if (output.progressive !== undefined) formData.append('progressive', output.progressive.toString());
+    if (output.pngCompression !== undefined) formData.append('png_compression', output.pngCompression.toString());
+    if (output.stream) formData.append('stream', 'true');
 
     const response = await fetch(`${API_BASE_URL}/mosaic/create`, {
       method: 'POST',
       body: formData,
     });
 
+    // streamed mosaics come back as image bytes, errors are still json
+    const contentType = response.headers.get('Content-Type') || '';
+    if (output.stream && response.ok && contentType.startsWith('image/')) {
+      const blob = await response.blob();
+      return { data: URL.createObjectURL(blob) };
+    }
+
     const data = await response.json();
     
     if (!response.ok) {
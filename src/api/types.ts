@@ -10,6 +10,15 @@ export interface MosaicConfig {
   enhanceColors: boolean;
 }
 
+export interface MosaicOutputOptions {
+  outputFormat?: 'jpeg' | 'webp' | 'png';
+  quality?: number;
+  progressive?: boolean;
+  pngCompression?: number;
+  // return the encoded image in the response instead of saving it on the server
+  stream?: boolean;
+}
+
 export interface ApiResponse<T> {
   data?: T;
   error?: string;